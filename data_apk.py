@@ -5,182 +5,248 @@ Single-file Streamlit app that lets users:
  2. Define variable names and types (short text, long text, number, date).
  3. Enter data row-by-row using generated input widgets.
  4. Upload a CSV (validated against the schema) to bulk add rows.
- 5. See the collected data in a table and download it as CSV.
+ 5. See the collected data in a table and download it as CSV or JSON.
 
 How to run:
  1. Make sure you have Python 3.8+ installed.
  2. Install dependencies:
-      pip install streamlit pandas
+      pip install streamlit pandas pyarrow msgspec
  3. Run the app:
       streamlit run streamlit_statistics_app.py
 
 Notes:
  - This app uses st.session_state to persist schema and rows while the app runs.
  - If you want to persist between restarts, you'll need to save to a file/db.
+ - Dates in uploaded CSVs are expected as ISO-8601 (YYYY-MM-DD); other
+   formats are still accepted but parsed more slowly.
 
 """
 
 import streamlit as st
-import pandas as pd
-from io import StringIO
+from streamlit.errors import StreamlitAPIException
+import msgspec
+from array import array
+from collections import Counter
+from io import BytesIO, StringIO
 import datetime
+import functools
+import uuid
+
+CSV_CHUNKSIZE = 10_000  # rows per chunk when importing an uploaded CSV
+# a UTC offset after a time of day, e.g. '10:00+02:00' or '10:00:00Z'
+TZ_SUFFIX = r'(\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)\s*(?:Z|[+-]\d{2}:?\d{2})$'
+TYPES = ('short text', 'long text', 'number', 'date')
 
 # ----------------------------- Helpers -----------------------------
 
+@functools.lru_cache(maxsize=None)
+def _pd():
+    # pandas is imported on first use so the page can start rendering before it loads
+    import pandas
+    return pandas
+
+
 def init_state():
     if 'schema' not in st.session_state:
         st.session_state.schema = []  # list of {'name':..., 'type':...}
-    if 'rows' not in st.session_state:
-        st.session_state.rows = []  # list of dict rows
+    if 'columns' not in st.session_state:
+        st.session_state.columns = {}  # column name -> list (or array('d') for numbers)
+    if 'rows_version' not in st.session_state:
+        st.session_state.rows_version = 0  # bumped whenever columns change
+    if 'data_id' not in st.session_state:
+        # st.cache_data is shared across sessions, so cache keys need a per-session id
+        st.session_state.data_id = uuid.uuid4().hex
     if 'num_vars' not in st.session_state:
         st.session_state.num_vars = 3
-    if 'temp_fields' not in st.session_state:
-        st.session_state.temp_fields = {}
+    if 'schema_fields' not in st.session_state:
+        st.session_state.schema_fields = {'name': [], 'type': []}  # last schema editor values
+    if 'schema_cols' not in st.session_state:
+        st.session_state.schema_cols = []  # cached column names, in schema order
+    if 'schema_types' not in st.session_state:
+        st.session_state.schema_types = {}  # cached name -> type mapping
+    if 'schema_groups' not in st.session_state:
+        st.session_state.schema_groups = ((), (), ())  # see partition_schema
+
+
+def empty_columns():
+    # number columns hold unboxed float64 values, with NaN for missing
+    return {name: array('d') if ftype == 'number' else []
+            for name, ftype in st.session_state.schema_types.items()}
+
+
+def bump_rows_version():
+    st.session_state.rows_version += 1
+
+
+def rerun_fragment():
+    # scope='fragment' is only allowed while a fragment is rerunning on its own;
+    # when the whole script is running, fall back to a full rerun
+    try:
+        st.rerun(scope='fragment')
+    except StreamlitAPIException:
+        st.rerun()
+
+
+@st.cache_data(max_entries=32)
+def build_df(data_id, version, _columns, _schema_types):
+    # leading-underscore args are not hashed: (data_id, version) is the cache key
+    import numpy as np
+    pd = _pd()
+    data = {}
+    for name, ftype in _schema_types.items():
+        col = _columns[name]
+        if ftype == 'number':
+            data[name] = np.frombuffer(col, dtype='float64')
+        elif ftype == 'date':
+            data[name] = col
+        else:
+            # arrow-backed strings hand st.dataframe a ready-made Arrow buffer
+            data[name] = pd.array(col, dtype='string[pyarrow]')
+    # dict input is copied, so no view into the growable buffers outlives this call
+    return pd.DataFrame(data)
+
+
+def _json_enc_hook(obj):
+    # number columns are array('d'); NaN is written as null
+    if isinstance(obj, array):
+        return obj.tolist()
+    raise NotImplementedError(f'Objects of type {type(obj)} are not supported')
+
+
+JSON_ENCODER = msgspec.json.Encoder(enc_hook=_json_enc_hook)
+
+
+@st.cache_data(max_entries=32)
+def encode_json(data_id, version, _columns):
+    # column-oriented, as stored: {"name": [values...], ...}; dates as ISO strings
+    return JSON_ENCODER.encode(_columns)
+
+
+@st.cache_data(max_entries=32)
+def encode_csv(data_id, version, _df):
+    # write straight into a bytes buffer instead of building a str and encoding it
+    buf = BytesIO()
+    _df.to_csv(buf, index=False, encoding='utf-8')
+    return buf.getvalue()
 
 
 def schema_to_dataframe():
+    pd = _pd()
     if not st.session_state.schema:
         return pd.DataFrame()
-    cols = [s['name'] for s in st.session_state.schema]
-    return pd.DataFrame(st.session_state.rows, columns=cols)
+    return build_df(st.session_state.data_id, st.session_state.rows_version,
+                    st.session_state.columns, st.session_state.schema_types)
+
+
+def partition_schema(schema):
+    """Split schema field names by type, so rows can be cast without
+    re-checking each field's type.
+    Returns (number_fields, date_fields, text_fields) as tuples of names.
+    """
+    number_fields = tuple(f['name'] for f in schema if f['type'] == 'number')
+    date_fields = tuple(f['name'] for f in schema if f['type'] == 'date')
+    text_fields = tuple(f['name'] for f in schema if f['type'] not in ('number', 'date'))
+    return number_fields, date_fields, text_fields
+
+
+def blank_to_none(val):
+    # empty-string handling: treat as None
+    if isinstance(val, str) and val.strip() == '':
+        return None
+    return val
 
 
 def validate_and_cast(row_dict):
     """Validate a single row (dict) using schema, cast types if needed.
     Returns (ok: bool, row_or_error: dict/str)
     """
-    out = {}
-    for field in st.session_state.schema:
-        name = field['name']
-        ftype = field['type']
-        val = row_dict.get(name, None)
-        # empty-string handling: treat as None
-        if isinstance(val, str) and val.strip() == '':
-            val = None
+    number_fields, date_fields, text_fields = st.session_state.schema_groups
+    out = dict.fromkeys(st.session_state.schema_cols)  # schema order, None by default
+    for name in number_fields:
+        val = blank_to_none(row_dict.get(name))
         if val is None:
-            out[name] = None
+            out[name] = float('nan')
             continue
-        try:
-            if ftype == 'number':
-                # allow integer or float
+        if isinstance(val, str):
+            # plain decimals like -12 or 3.5 can't fail, so skip the try block
+            val = val.strip()
+            digits = val[1:] if val[:1] in ('+', '-') else val
+            if digits.replace('.', '', 1).isdecimal():
                 out[name] = float(val)
-            elif ftype == 'date':
-                if isinstance(val, datetime.date):
-                    out[name] = val
-                else:
-                    out[name] = pd.to_datetime(val).date()
-            else:  # short text or long text
-                out[name] = str(val)
+                continue
+        try:
+            # allow integer or float
+            out[name] = float(val)
+        except Exception as e:
+            return False, f"Error casting field '{name}' to number: {e}"
+    for name in date_fields:
+        val = blank_to_none(row_dict.get(name))
+        if val is None:
+            continue
+        try:
+            out[name] = val if isinstance(val, datetime.date) else _pd().to_datetime(val).date()
         except Exception as e:
-            return False, f"Error casting field '{name}' to {ftype}: {e}"
+            return False, f"Error casting field '{name}' to date: {e}"
+    for name in text_fields:  # short text or long text
+        val = blank_to_none(row_dict.get(name))
+        if val is not None:
+            out[name] = str(val)
     return True, out
 
 
-# ----------------------------- UI -----------------------------
-
-init_state()
-
-st.set_page_config(page_title='Statistics data-entry app', layout='wide')
-st.title('📊 Simple Statistics App (Streamlit)')
-st.write('Create a simple schema, enter rows, preview table, and download CSV.')
-
-# Optional metadata at top
-with st.expander('Developer / App metadata (optional)', expanded=False):
-    dev_link = st.text_input('Developer CV or project link (optional)', '')
-
-st.markdown('---')
-
-# Step 1: choose number of variables
-col1, col2 = st.columns([1,3])
-with col1:
-    n = st.number_input('How many variables?', min_value=1, max_value=50, value=st.session_state.num_vars, step=1)
-    if n != st.session_state.num_vars:
-        st.session_state.num_vars = int(n)
-
-with col2:
-    st.info('After setting the number, click **Create fields** to generate inputs for variable names and types.')
+def parse_dates(col):
+    """Parse a column of dates, trying ISO-8601 (YYYY-MM-DD) first.
+    Values that don't match fall back to pandas' per-value format inference.
+    UTC offsets are dropped so each value keeps its own local date; values
+    that can't be parsed come back as NaT.
+    """
+    pd = _pd()
+    if pd.api.types.is_string_dtype(col.dtype):
+        col = col.str.replace(TZ_SUFFIX, r'\1', regex=True)
+    # utc=True keeps any remaining timezone-aware values from failing the whole column
+    parsed = pd.to_datetime(col, errors='coerce', format='ISO8601', utc=True, cache=True)
+    retry = parsed.isna() & col.notna()
+    if retry.any():
+        fallback = pd.to_datetime(col[retry], errors='coerce', format='mixed', utc=True, cache=True)
+        parsed = parsed.where(~retry, fallback)
+    return parsed
 
-if st.button('Create fields'):
-    # initialize temp fields
-    st.session_state.temp_fields = {}
-    for i in range(st.session_state.num_vars):
-        st.session_state.temp_fields[f'name_{i}'] = ''
-        st.session_state.temp_fields[f'type_{i}'] = 'short text'
-    st.rerun()
 
-# Show variable creation UI if temp_fields exists or schema empty
-show_fields = True if st.session_state.schema == [] or st.session_state.temp_fields else True
-if show_fields:
-    st.subheader('Define variables (name and type)')
-    placeholder = st.container()
-    with placeholder:
-        fields_changed = False
-        for i in range(st.session_state.num_vars):
-            cols = st.columns([3,2])
-            name_key = f'name_{i}'
-            type_key = f'type_{i}'
-            current_name = st.session_state.temp_fields.get(name_key, '')
-            current_type = st.session_state.temp_fields.get(type_key, 'short text')
-            new_name = cols[0].text_input(f'Variable #{i+1} name', value=current_name, key=name_key)
-            new_type = cols[1].selectbox('Type', options=['short text','long text','number','date'], index=['short text','long text','number','date'].index(current_type), key=type_key)
-            # update temp_fields
-            if st.session_state.temp_fields.get(name_key) != new_name or st.session_state.temp_fields.get(type_key) != new_type:
-                st.session_state.temp_fields[name_key] = new_name
-                st.session_state.temp_fields[type_key] = new_type
-                fields_changed = True
-
-    if st.button('Save schema'):
-        # collect names/types, validate
-        new_schema = []
-        seen = set()
-        ok = True
-        msg = ''
-        for i in range(st.session_state.num_vars):
-            nm = st.session_state.temp_fields.get(f'name_{i}', '').strip()
-            tp = st.session_state.temp_fields.get(f'type_{i}', 'short text')
-            if nm == '':
-                ok = False
-                msg = f'Variable name #{i+1} is empty.'
-                break
-            if nm in seen:
-                ok = False
-                msg = f"Duplicate variable name: '{nm}'."
-                break
-            seen.add(nm)
-            new_schema.append({'name': nm, 'type': tp})
-        if not ok:
-            st.error(msg)
+def validate_and_cast_frame(df):
+    """Validate a whole DataFrame using schema, casting one column at a time.
+    Returns (valid_rows: DataFrame, errors: list of str)
+    """
+    pd = _pd()
+    out = pd.DataFrame(index=df.index)
+    bad_mask = pd.Series(False, index=df.index)
+    errors = []
+    for name, ftype in st.session_state.schema_types.items():
+        col = df[name]
+        # empty-string handling: treat as None
+        if pd.api.types.is_string_dtype(col.dtype):
+            col = col.where(col.astype(str).str.strip() != '')
+        present = col.notna()
+        if ftype == 'number':
+            casted = pd.to_numeric(col, errors='coerce')
+        elif ftype == 'date':
+            casted = parse_dates(col).dt.date
+        else:  # short text or long text
+            casted = col.astype(str)
+        failed = present & casted.isna()
+        # idx is the 0-based data row; +2 for the header and 1-based numbering
+        errors.extend(f"Line {idx + 2}: error casting field '{name}' to {ftype}: {val!r}"
+                      for idx, val in col[failed].items())
+        bad_mask |= failed
+        if ftype == 'number':
+            out[name] = casted  # float64, NaN for missing
         else:
-            st.session_state.schema = new_schema
-            # create empty rows list and reset temp fields
-            st.session_state.rows = []
-            st.session_state.temp_fields = {}
-            st.success('Schema saved — now enter data below.')
-            st.rerun()
+            out[name] = casted.astype(object).where(present, None)
+    return out[~bad_mask], errors
 
-# Show current schema
-if st.session_state.schema:
-    st.subheader('Current schema')
-    schema_df = pd.DataFrame(st.session_state.schema)
-    st.table(schema_df)
 
-    # Buttons: reset schema
-    c1, c2, c3 = st.columns([1,1,1])
-    with c1:
-        if st.button('Reset schema and data'):
-            st.session_state.schema = []
-            st.session_state.rows = []
-            st.rerun()
-    with c2:
-        if st.button('Clear data (keep schema)'):
-            st.session_state.rows = []
-            st.rerun()
-    with c3:
-        st.write('')
+# ----------------------------- Fragments -----------------------------
 
-    st.markdown('---')
-
-    # Step 2: Data entry form
+def row_entry_form():
     st.subheader('Enter a new row')
     with st.form('add_row_form'):
         new_row = {}
@@ -203,51 +269,213 @@ if st.session_state.schema:
             if not ok:
                 st.error(result)
             else:
-                st.session_state.rows.append(result)
+                for name, val in result.items():
+                    st.session_state.columns[name].append(val)
+                bump_rows_version()
                 st.success('Row added.')
-                st.rerun()
+                rerun_fragment()
 
-    # Step 3: Bulk upload via CSV
+
+def csv_upload():
+    import numpy as np
+    pd = _pd()
     st.subheader('Bulk add: upload CSV (columns must match schema names)')
     uploaded = st.file_uploader('Upload CSV file', type=['csv'])
-    if uploaded is not None:
+    # the uploader keeps its file across reruns, so only import each upload once
+    if uploaded is not None and uploaded.file_id != st.session_state.get('last_upload_id'):
+        # recorded up front so a file that fails to import isn't retried on every rerun
+        st.session_state.last_upload_id = uploaded.file_id
+        # column lengths before the import, to roll back if a later chunk fails
+        start_lens = {name: len(col) for name, col in st.session_state.columns.items()}
         try:
-            df_new = pd.read_csv(uploaded)
-            expected_cols = [s['name'] for s in st.session_state.schema]
-            missing = [c for c in expected_cols if c not in df_new.columns]
-            extra = [c for c in df_new.columns if c not in expected_cols]
+            # read just the header first so missing columns are reported up front
+            header = pd.read_csv(uploaded, nrows=0).columns
+            uploaded.seek(0)
+            expected_cols = st.session_state.schema_cols
+            missing = [c for c in expected_cols if c not in header]
+            extra = [c for c in header if c not in expected_cols]
             if missing:
                 st.error(f'Missing columns in uploaded CSV: {missing}')
             else:
-                # take only expected cols in schema order
-                df_new = df_new[expected_cols]
-                # validate and cast each row
+                # keep text and date columns as strings; numbers are coerced
+                # per column so a bad value only rejects its own row
+                dtype_map = {name: str for name, ftype in st.session_state.schema_types.items()
+                             if ftype != 'number'}
+                # no usecols: it would silently drop extra fields on malformed
+                # lines, while a full read rejects them like the plain read_csv did
+                reader = pd.read_csv(uploaded, dtype=dtype_map, chunksize=CSV_CHUNKSIZE)
                 bad_rows = []
                 added = 0
-                for _, r in df_new.iterrows():
-                    rowdict = r.to_dict()
-                    ok, res = validate_and_cast(rowdict)
-                    if not ok:
-                        bad_rows.append(str(res))
-                    else:
-                        st.session_state.rows.append(res)
-                        added += 1
+                for chunk in reader:
+                    # take only expected cols in schema order, validate column-wise
+                    good_rows, errors = validate_and_cast_frame(chunk[expected_cols])
+                    for name in expected_cols:
+                        col = st.session_state.columns[name]
+                        if isinstance(col, array):
+                            # copy the float64 buffer in instead of boxing each value;
+                            # a byte view avoids an intermediate bytes copy
+                            values = np.ascontiguousarray(good_rows[name].to_numpy(dtype='float64'))
+                            col.frombytes(memoryview(values).cast('B'))
+                        else:
+                            col.extend(good_rows[name].tolist())
+                    added += len(good_rows)
+                    bad_rows.extend(errors[:5 - len(bad_rows)])
+                if added:
+                    bump_rows_version()
                 if bad_rows:
                     st.warning(f"Some rows failed to import (showing up to 5 errors): {bad_rows[:5]}")
+                # no rerun: the preview below renders in this same pass and
+                # already sees the new rows, and the messages stay on screen
                 st.success(f'Imported {added} rows from CSV.')
-                st.rerun()
         except Exception as e:
+            # all-or-nothing: drop the rows earlier chunks already appended
+            for name, n in start_lens.items():
+                del st.session_state.columns[name][n:]
             st.error(f'Error reading CSV: {e}')
 
-    # Show table and download
+
+@st.fragment
+def preview_fragment():
     st.subheader('Data table')
     df = schema_to_dataframe()
     if df.empty:
         st.info('No rows yet — add some using the form above or upload a CSV.')
     else:
         st.dataframe(df)
-        csv = df.to_csv(index=False).encode('utf-8')
+        csv = encode_csv(st.session_state.data_id, st.session_state.rows_version, df)
         st.download_button('Download CSV', data=csv, file_name='data.csv', mime='text/csv')
+        json_bytes = encode_json(st.session_state.data_id, st.session_state.rows_version,
+                                 st.session_state.columns)
+        st.download_button('Download JSON', data=json_bytes, file_name='data.json', mime='application/json')
+
+
+@st.fragment
+def data_entry_fragment():
+    # adding rows reruns only this fragment, not the schema editor above it
+    # Step 2: Data entry form
+    row_entry_form()
+
+    # Step 3: Bulk upload via CSV
+    csv_upload()
+
+    # Show table and download
+    preview_fragment()
+
+
+# ----------------------------- UI -----------------------------
+
+init_state()
+
+st.set_page_config(page_title='Statistics data-entry app', layout='wide')
+st.title('📊 Simple Statistics App (Streamlit)')
+st.write('Create a simple schema, enter rows, preview table, and download CSV.')
+
+# Optional metadata at top
+with st.expander('Developer / App metadata (optional)', expanded=False):
+    dev_link = st.text_input('Developer CV or project link (optional)', '')
+
+st.markdown('---')
+
+# Step 1: choose number of variables
+col1, col2 = st.columns([1,3])
+with col1:
+    n = st.number_input('How many variables?', min_value=1, max_value=50, value=st.session_state.num_vars, step=1)
+    if n != st.session_state.num_vars:
+        st.session_state.num_vars = int(n)
+
+with col2:
+    st.info('After setting the number, click **Create fields** to generate inputs for variable names and types.')
+
+if st.button('Create fields'):
+    # drop any pending edits so the schema editor starts from blank fields
+    st.session_state.pop('schema_editor', None)
+    st.session_state.schema_fields = {'name': [], 'type': []}
+    st.rerun()
+
+# Step 1b: define variable names and types (the editor is always shown,
+# so a saved schema can be redefined)
+st.subheader('Define variables (name and type)')
+placeholder = st.container()
+with placeholder:
+    # one data_editor instead of a text_input + selectbox per variable.
+    # The editor's identity includes its row count, so changing the number
+    # of variables resets its state: seed it from the last edited values,
+    # padded or trimmed to num_vars, so names and types already typed survive.
+    num_vars = st.session_state.num_vars
+    last = st.session_state.schema_fields
+    seed = {
+        '#': list(range(1, num_vars + 1)),  # matches the numbering in Save schema errors
+        'name': (list(last['name']) + [''] * num_vars)[:num_vars],
+        'type': (list(last['type']) + ['short text'] * num_vars)[:num_vars],
+    }
+    edited = st.data_editor(
+        seed,
+        column_config={
+            '#': st.column_config.NumberColumn('#', disabled=True),
+            'name': st.column_config.TextColumn('Variable name'),
+            'type': st.column_config.SelectboxColumn('Type', options=TYPES, required=True),
+        },
+        num_rows='fixed',
+        hide_index=True,
+        key='schema_editor',
+    )
+    st.session_state.schema_fields = edited
+
+if st.button('Save schema'):
+    # collect names/types, validate
+    names = [nm.strip() if isinstance(nm, str) else '' for nm in edited['name']]
+    types = [tp if tp in TYPES else 'short text' for tp in edited['type']]
+    # report every problem at once, not just the first
+    problems = []
+    empty = [f'#{i+1}' for i, nm in enumerate(names) if nm == '']
+    if len(empty) == 1:
+        problems.append(f'Variable name {empty[0]} is empty.')
+    elif empty:
+        problems.append(f"Variable names {', '.join(empty)} are empty.")
+    dupes = [nm for nm, count in Counter(names).items() if count > 1 and nm != '']
+    if dupes:
+        problems.append(f'Duplicate variable names: {dupes}.')
+    if problems:
+        st.error(' '.join(problems))
+    else:
+        new_schema = [{'name': nm, 'type': tp} for nm, tp in zip(names, types)]
+        st.session_state.schema = new_schema
+        st.session_state.schema_cols = [s['name'] for s in new_schema]
+        st.session_state.schema_types = {s['name']: s['type'] for s in new_schema}
+        st.session_state.schema_groups = partition_schema(new_schema)
+        # create empty columns
+        st.session_state.columns = empty_columns()
+        bump_rows_version()
+        st.success('Schema saved — now enter data below.')
+        st.rerun()
+
+# Show current schema
+if st.session_state.schema:
+    st.subheader('Current schema')
+    st.table(st.session_state.schema)
+
+    # Buttons: reset schema
+    c1, c2, c3 = st.columns([1,1,1])
+    with c1:
+        if st.button('Reset schema and data'):
+            st.session_state.schema = []
+            st.session_state.schema_cols = []
+            st.session_state.schema_types = {}
+            st.session_state.schema_groups = ((), (), ())
+            st.session_state.columns = {}
+            bump_rows_version()
+            st.rerun()
+    with c2:
+        if st.button('Clear data (keep schema)'):
+            st.session_state.columns = empty_columns()
+            bump_rows_version()
+            st.rerun()
+    with c3:
+        st.write('')
+
+    st.markdown('---')
+
+    data_entry_fragment()
 
 else:
     st.info('Define a schema to get started (choose number of variables and click Create fields).')